@@ -1,13 +1,18 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
 from google.cloud import bigquery
+from google.cloud import bigquery_storage
 from google.oauth2 import service_account
 import os
+import glob
+import hashlib
+import tempfile
+import time
 import logging
-import pytz
+import pyarrow as pa
+import pyarrow.compute as pc
 import numpy as np
-from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
 
 # =========================
 # 🧾 CONFIG & LOGGING
@@ -57,22 +62,90 @@ st.markdown("""
 # =========================
 # 🛠️ 2. UTILITIES
 # =========================
-def clean_title(title, max_len=30):
-    if len(title) > max_len: return title[:max_len] + "..."
-    return title
+def clean_title(titles, max_len=30):
+    """Truncates a Series of titles to `max_len` characters, appending '...' when cut."""
+    return titles.where(titles.str.len() <= max_len, titles.str.slice(0, max_len) + "...")
 
-def format_views(num):
+def format_views(values):
     """
-    Smart formatting for view counts.
+    Smart formatting for view counts. Accepts a scalar or a whole array/Series
+    (one call per column instead of one per row).
     31,392,500 -> 31.4M
     500,000    -> 500.0K
+    NaN        -> N/A
     """
-    if num >= 1_000_000:
-        return f"{num/1_000_000:.1f}M"
-    elif num >= 1_000:
-        return f"{num/1_000:.1f}K"
-    else:
-        return str(num)
+    raw = np.asarray(values, dtype=np.float64)
+    # Counts with nulls stay float in the frame; mask NaN before the int cast
+    missing = np.isnan(raw)
+    counts = np.where(missing, 0, raw).astype(np.int64)
+    # Magnitude class without branching: 0 = units, 1 = thousands, 2 = millions
+    mag = (counts >= 1_000).astype(np.int8) + (counts >= 1_000_000)
+    scaled = counts / np.array([1, 1_000, 1_000_000])[mag]
+    suffix = np.array(["", "K", "M"])[mag]
+    labels = [
+        "N/A" if na else f"{v:.1f}{sfx}" if m else str(int(v))
+        for v, sfx, m, na in zip(scaled.ravel(), suffix.ravel(), mag.ravel(), missing.ravel())
+    ]
+    return labels[0] if counts.ndim == 0 else np.array(labels).reshape(counts.shape)
+
+LTTB_POINTS = 2000  # Max points per Plotly trace before downsampling kicks in
+
+def lttb_indices(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets: picks `n_out` point indices that keep the visual
+    shape of the (x, y) series. Series with `n_out` points or fewer are kept whole.
+    """
+    n = len(x)
+    if n <= n_out or n_out < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # First and last points are always kept; the rest is split into n_out - 2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    edges = np.append(edges, n)
+
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end, next_end = edges[i], edges[i + 1], edges[i + 2]
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(area.argmax())
+        keep[i + 1] = a
+    return keep
+
+def downsample_traces(df, x, y, by, n_out=LTTB_POINTS):
+    """
+    Applies LTTB to every `by` group (one Plotly trace each) so no trace ships more
+    than `n_out` points to the browser.
+    """
+    if len(df) <= n_out:
+        return df
+
+    xs = df[x].astype("int64").to_numpy() if pd.api.types.is_datetime64_any_dtype(df[x]) else df[x].to_numpy()
+    ys = df[y].to_numpy()
+    keep = []
+    for rows in df.groupby(by, sort=False).indices.values():
+        rows = rows[np.argsort(xs[rows], kind="stable")]
+        keep.append(rows[lttb_indices(xs[rows], ys[rows], n_out)])
+    return df.iloc[np.sort(np.concatenate(keep))]
+
+DAYS_ORDER = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+def heatmap_matrix(df_heat):
+    """
+    Scatters the (publish_day, publish_hour, count) summary into a 7 x 24 grid by
+    direct indexing. Each (day, hour) pair is unique, so no pivot/aggregation is needed.
+    """
+    grid = np.zeros((len(DAYS_ORDER), 24), dtype=np.int32)
+    day_codes = pd.Categorical(df_heat["publish_day"], categories=DAYS_ORDER).codes
+    grid[day_codes, df_heat["publish_hour"].to_numpy()] = df_heat["count"].to_numpy()
+    return grid
 
 def ui_error_message(title, message, details=None):
     st.error(f"**{title}**")
@@ -85,15 +158,19 @@ def ui_error_message(title, message, details=None):
 # =========================
 @st.cache_resource
 def get_bigquery_client():
+    """
+    Returns a (BigQuery client, BQ Storage read client) pair built from the same credentials.
+    The Storage client streams query results as Arrow instead of paging JSON rows.
+    """
     try:
         if "gcp_service_account" in st.secrets:
             creds = service_account.Credentials.from_service_account_info(st.secrets["gcp_service_account"])
-            return bigquery.Client(credentials=creds, project=creds.project_id)
+            return bigquery.Client(credentials=creds, project=creds.project_id), bigquery_storage.BigQueryReadClient(credentials=creds)
         
         key_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "service_key.json")
         if os.path.exists(key_path):
             creds = service_account.Credentials.from_service_account_file(key_path)
-            return bigquery.Client(credentials=creds, project=creds.project_id)
+            return bigquery.Client(credentials=creds, project=creds.project_id), bigquery_storage.BigQueryReadClient(credentials=creds)
             
         raise FileNotFoundError("Missing 'service_key.json' or secrets.toml")
     except Exception as e:
@@ -103,54 +180,142 @@ def get_bigquery_client():
 # =========================
 # 📥 4. DATA LOADING
 # =========================
-@st.cache_data(ttl=300)
-def load_data():
-    client = get_bigquery_client()
-    query = """
-        SELECT *
-        FROM `youtube_analytics.fact_video_metrics`
-        WHERE snapshot_at >= DATETIME_SUB(CURRENT_DATETIME(), INTERVAL 7 DAY)
-        ORDER BY snapshot_at ASC
+CACHE_TTL = 300  # seconds
+
+HISTORY_QUERY = """
+    SELECT
+        snapshot_at, published_at, video_id, video_title, channel_name, sector,
+        view_count, like_count, comment_count, thumbnail_url, dominant_color
+    FROM `youtube_analytics.fact_video_metrics`
+    WHERE snapshot_at >= DATETIME_SUB(CURRENT_DATETIME(), INTERVAL 7 DAY)
+"""
+
+def query_arrow(query):
+    client, bqstorage_client = get_bigquery_client()
+    # Arrow over the Storage API (LZ4-compressed, multi-stream) instead of tabledata.list JSON
+    return client.query(query).result().to_arrow(
+        bqstorage_client=bqstorage_client, create_bqstorage_client=True
+    )
+
+@st.cache_resource(ttl=CACHE_TTL)
+def load_arrow_table(query):
     """
-    try:
-        df = client.query(query).to_dataframe()
-        if df.empty: return pd.DataFrame()
-        
-        # 🟢 TIMEZONE CONVERSION (UTC -> IST)
-        ist = pytz.timezone('Asia/Kolkata')
-        
-        def convert_to_ist(series):
-            if series.dt.tz is None:
-                series = series.dt.tz_localize('UTC')
-            return series.dt.tz_convert(ist)
-
-        df["snapshot_at"] = convert_to_ist(pd.to_datetime(df["snapshot_at"]))
-        df["published_at"] = convert_to_ist(pd.to_datetime(df["published_at"]))
-        df["upload_time_str"] = df["published_at"].dt.strftime('%d %b, %I:%M %p')
-
-        # Engagement Rate
-        df["engagement_rate"] = np.where(
-            df["view_count"] > 0,
-            ((df["like_count"] + df["comment_count"]) / df["view_count"]) * 100,
-            0
-        )
+    Runs `query` at most once per TTL window and returns a memory-mapped Arrow table
+    sorted by snapshot_at (the velocity chart needs time order).
+    The result is written to an Arrow IPC file in /tmp (keyed by query hash + window),
+    so every session shares one mapping instead of unpickling its own DataFrame.
+    """
+    query_key = hashlib.sha1(query.encode("utf-8")).hexdigest()[:16]
+    window = int(time.time() // CACHE_TTL)
+    prefix = os.path.join(tempfile.gettempdir(), f"yt_cache_{query_key}_")
+    path = f"{prefix}{window}.arrow"
 
-        df["short_title"] = df["video_title"].apply(lambda x: clean_title(x))
-        df["is_caps"] = df["video_title"].apply(lambda x: 1 if x.isupper() else 0)
-        df["publish_hour"] = df["published_at"].dt.hour
-        df["publish_day"] = df["published_at"].dt.day_name()
-        
-        return df
+    if not os.path.exists(path):
+        # No ORDER BY in SQL (it pins the Storage API read to a single stream); sort locally
+        table = query_arrow(query).sort_by("snapshot_at")
+        # Write to a temp file first so concurrent readers never map a half-written file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp_path, path)
+
+        for stale in glob.glob(f"{prefix}*.arrow"):
+            if stale != path:
+                try:
+                    os.remove(stale)
+                except FileNotFoundError:
+                    pass  # Already cleaned up by another worker
+
+    return pa.ipc.open_file(pa.memory_map(path)).read_all()
+
+def to_dashboard_frame(table):
+    """Converts a fact_video_metrics Arrow table into the DataFrame the tabs render from."""
+    # The history table is a shared mapping, so it must not be self-destructed here.
+    # Low-cardinality labels come out dictionary-encoded (category) straight from Arrow.
+    df = table.to_pandas(
+        split_blocks=True, categories=["channel_name", "sector", "dominant_color"]
+    )
+    if df.empty: return pd.DataFrame()
+
+    # Counts fit in int32 for anything short of a 2B+ view video
+    for col in ("view_count", "like_count", "comment_count"):
+        if not df[col].hasnans and df[col].max() <= np.iinfo(np.int32).max:
+            df[col] = df[col].astype(np.int32)
+    
+    # 🟢 TIMEZONE CONVERSION (UTC -> IST)
+    ist = ZoneInfo('Asia/Kolkata')
+    
+    def convert_to_ist(series):
+        if series.dt.tz is None:
+            series = series.dt.tz_localize('UTC')
+        return series.dt.tz_convert(ist)
+
+    df["snapshot_at"] = convert_to_ist(pd.to_datetime(df["snapshot_at"]))
+    df["published_at"] = convert_to_ist(pd.to_datetime(df["published_at"]))
+    df["upload_time_str"] = df["published_at"].dt.strftime('%d %b, %I:%M %p')
+
+    # Engagement Rate (single float32 buffer, divided only where views > 0)
+    views = df["view_count"].to_numpy()
+    interactions = df["like_count"].to_numpy(np.float32) + df["comment_count"].to_numpy(np.float32)
+    engagement = np.zeros_like(interactions)
+    np.divide(interactions, views, out=engagement, where=views > 0)
+    engagement *= 100
+    df["engagement_rate"] = engagement
+
+    df["short_title"] = clean_title(df["video_title"])
+    df["is_caps"] = df["video_title"].str.isupper().astype("int8")
+    df["publish_hour"] = df["published_at"].dt.hour
+    df["publish_day"] = df["published_at"].dt.day_name()
+    
+    return df
 
+def history_table_key(table):
+    """Cheap cache key for the history table: a new ETL batch changes the row count or newest snapshot."""
+    return table.num_rows, pc.max(table["snapshot_at"]).as_py()
+
+@st.cache_resource(ttl=CACHE_TTL, hash_funcs={pa.Table: history_table_key})
+def enrich_history(table):
+    """
+    Derived history columns, computed once per ETL batch instead of on every widget rerun.
+    One frame is shared by every session (never mutated downstream), so nothing is unpickled per rerun.
+    """
+    return to_dashboard_frame(table)
+
+def load_data():
+    """Returns the shared history table and its derived DataFrame."""
+    try:
+        table = load_arrow_table(HISTORY_QUERY)
+        return table, enrich_history(table)
     except Exception as e:
         ui_error_message("Data Error", "Could not load data.", str(e))
         st.stop()
 
+@st.cache_data(ttl=CACHE_TTL, hash_funcs={pa.Table: history_table_key})
+def load_latest(table, sector):
+    """
+    Latest ETL batch for `sector` (one row per video, ranked by view_count) and its
+    7 x 24 upload-count heatmap, both sliced from the history already in memory.
+    Keyed on the history batch + sector, so header, KPIs and heatmap always agree.
+    """
+    df = enrich_history(table)
+    if sector != "All":
+        df = df[df["sector"] == sector]
+    if df.empty:
+        return df, np.zeros((len(DAYS_ORDER), 24), dtype=np.int32)
+
+    latest = df[df["snapshot_at"] >= df["snapshot_at"].max() - pd.Timedelta(minutes=15)]
+    # Newest snapshot per video via a hashed groupby, no full sort needed
+    newest = latest.groupby("video_id", sort=False)["snapshot_at"].idxmax()
+    df_latest = latest.loc[newest].sort_values("view_count", ascending=False)
+
+    df_heat = df_latest.groupby(["publish_day", "publish_hour"]).size().reset_index(name="count")
+    return df_latest, heatmap_matrix(df_heat)
+
 # =========================
 # 🧠 5. DASHBOARD ENGINE
 # =========================
 def main():
-    df_raw = load_data()
+    history, df_raw = load_data()
     if df_raw.empty:
         st.warning("⚠️ No data. Run `python -m src.etl`")
         st.stop()
@@ -158,23 +323,21 @@ def main():
     # --- SIDEBAR ---
     with st.sidebar:
         st.header("⚡ Control Center")
-        sectors = ["All"] + sorted(df_raw["sector"].unique().tolist())
+        # Categories are the distinct sectors already, no need to scan every row
+        sectors = ["All"] + sorted(df_raw["sector"].cat.categories.tolist())
         selected_sector = st.selectbox("Industry Sector:", sectors)
         
         if selected_sector != "All":
             df_filtered = df_raw[df_raw["sector"] == selected_sector]
         else:
-            df_filtered = df_raw.copy()
+            df_filtered = df_raw
             
         st.markdown("---")
         st.info("**Narendra Bhandari**\n\nv4.0 Smart Formatting")
 
     # --- FILTER LOGIC (Latest Batch) ---
     latest_ts = df_filtered["snapshot_at"].max()
-    cutoff_time = latest_ts - timedelta(minutes=15)
-    
-    df_latest = df_filtered[df_filtered["snapshot_at"] >= cutoff_time].copy()
-    df_latest = df_latest.sort_values("snapshot_at", ascending=False).drop_duplicates(subset="video_id")
+    df_latest, heat_grid = load_latest(history, selected_sector)
 
     refresh_time_str = latest_ts.strftime('%d %b, %I:%M %p')
 
@@ -187,7 +350,7 @@ def main():
 
     # --- MAIN KPI ROW ---
     if not df_latest.empty:
-        top_vid = df_latest.sort_values("view_count", ascending=False).iloc[0]
+        top_vid = df_latest.iloc[0]
         c1, c2, c3, c4 = st.columns(4)
         # 🟢 UPDATED: Smart Format for Viral King
         with c1: st.metric("🔥 Viral King", format_views(top_vid['view_count']), top_vid['channel_name'])
@@ -214,17 +377,22 @@ def main():
     ])
 
     # 1. VELOCITY CHART
+    # plotly.express is imported lazily so the auth-failure and no-data paths never pay for it
     with tab_velocity:
+        import plotly.express as px
         if df_filtered["snapshot_at"].nunique() < 2:
             st.warning("⚠️ **Not enough history for Velocity Chart.** Run ETL again in 1 hour.")
         else:
+            # LTTB-downsample long traces before they are serialized to the browser
+            df_plot = downsample_traces(df_filtered, "snapshot_at", "view_count", "short_title")
             fig = px.line(
-                df_filtered, 
+                df_plot, 
                 x="snapshot_at", 
                 y="view_count", 
                 color="short_title", 
                 hover_name="video_title",
                 markers=True,
+                render_mode="webgl",
                 height=600,
                 template="plotly_white",
                 title="View Growth Over Time (IST)"
@@ -238,6 +406,7 @@ def main():
 
     # 2. COLOR PSYCHOLOGY
     with tab_color:
+        import plotly.express as px
         if "dominant_color" in df_latest.columns:
             fig_color = px.scatter(
                 df_latest,
@@ -249,40 +418,42 @@ def main():
                 template="plotly_dark",
                 height=500,
                 log_x=True, log_y=True,
+                render_mode="webgl",
                 title="Thumbnail Color Performance"
             )
             st.plotly_chart(fig_color, theme="streamlit", use_container_width=True)
 
     # 3. HEATMAP
     with tab_heat:
-        df_heat = df_latest.groupby(['publish_day', 'publish_hour']).size().reset_index(name='count')
-        days_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-        fig_heat = px.density_heatmap(
-            df_heat, x="publish_hour", y="publish_day", z="count", 
-            nbinsx=24, category_orders={"publish_day": days_order}, color_continuous_scale="Viridis"
+        import plotly.express as px
+        fig_heat = px.imshow(
+            heat_grid, x=list(range(24)), y=DAYS_ORDER,
+            labels=dict(x="publish_hour", y="publish_day", color="count"),
+            aspect="auto", color_continuous_scale="Viridis"
         )
         st.plotly_chart(fig_heat, theme="streamlit", use_container_width=True)
 
     # 4. PODIUM
     with tab_table:
         st.subheader("🏆 The Podium")
-        top_3 = df_latest.sort_values("view_count", ascending=False).head(3)
+        top_3 = df_latest.head(3)
+        top_3_views = format_views(top_3["view_count"])
         cols = st.columns(3)
         badges = ['<div class="gold-badge">🥇 GOLD</div>', '<div class="silver-badge">🥈 SILVER</div>', '<div class="bronze-badge">🥉 BRONZE</div>']
         
-        for i, (idx, vid) in enumerate(top_3.iterrows()):
+        for i, vid in enumerate(top_3.itertuples(index=False)):
             if i < 3:
                 with cols[i]:
                     st.markdown(badges[i], unsafe_allow_html=True)
-                    st.image(vid["thumbnail_url"])
-                    st.markdown(f"**{vid['short_title']}**")
+                    st.image(vid.thumbnail_url)
+                    st.markdown(f"**{vid.short_title}**")
                     # 🟢 UPDATED: Smart Format for Podium
-                    st.caption(f"👀 {format_views(vid['view_count'])} | 📅 {vid['upload_time_str']}")
+                    st.caption(f"👀 {top_3_views[i]} | 📅 {vid.upload_time_str}")
 
         st.divider()
         st.subheader("📋 Full Data")
         st.dataframe(
-            df_latest[["thumbnail_url", "channel_name", "video_title", "view_count", "engagement_rate", "upload_time_str"]].sort_values("view_count", ascending=False),
+            df_latest[["thumbnail_url", "channel_name", "video_title", "view_count", "engagement_rate", "upload_time_str"]],
             column_config={
                 "thumbnail_url": st.column_config.ImageColumn("Preview"),
                 "view_count": st.column_config.NumberColumn("Views", format="%d"),
@@ -295,7 +466,7 @@ def main():
     # 5. 🇮🇳 INDIA GALLERY
     with tab_india:
         # A. Calculate India Specific KPIs
-        india_latest = df_latest[df_latest['sector'] == 'india_top'].copy()
+        india_latest = df_latest[df_latest['sector'] == 'india_top']
         
         if india_latest.empty:
             st.info("No 'India Top' data found. Select the sector in the sidebar or check ETL.")
@@ -323,22 +494,23 @@ def main():
             
             # 🟢 VIDEO GRID
             cols = st.columns(4)
-            india_sorted = india_latest.sort_values("view_count", ascending=False)
 
-            for i, (index, row) in enumerate(india_sorted.iterrows()):
+            # df_latest is already ranked by views, so the India slice keeps that order
+            india_views = format_views(india_latest["view_count"])
+            for i, row in enumerate(india_latest.itertuples(index=False)):
                 col = cols[i % 4]
                 with col:
                     with st.container():
                         st.markdown('<div class="video-card">', unsafe_allow_html=True)
-                        st.image(row['thumbnail_url'], use_container_width=True)
-                        st.markdown(f"**{row['short_title']}**")
-                        st.caption(f"📺 {row['channel_name']}")
+                        st.image(row.thumbnail_url, use_container_width=True)
+                        st.markdown(f"**{row.short_title}**")
+                        st.caption(f"📺 {row.channel_name}")
                         
                         # Metrics Row inside Card
                         m1, m2 = st.columns(2)
                         # 🟢 UPDATED: Smart Format for Grid
-                        with m1: st.metric("Views", format_views(row['view_count']))
-                        with m2: st.metric("Eng.", f"{row['engagement_rate']:.1f}%")
+                        with m1: st.metric("Views", india_views[i])
+                        with m2: st.metric("Eng.", f"{row.engagement_rate:.1f}%")
                         
                         st.markdown('</div>', unsafe_allow_html=True)
 
@@ -1,20 +1,65 @@
 import yaml
 import os
 import json
-import pandas as pd
-import pandas_gbq
+import asyncio
+import aiohttp
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from google.cloud import bigquery
 from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from datetime import datetime
+from datetime import datetime, timezone
 import streamlit as st
 from image_utils import get_dominant_color
 
+# libyaml-backed loader when available (~10x faster), pure-Python otherwise
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
 # --- CONFIG & PATHS ---
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 CONFIG_PATH = os.path.join(BASE_DIR, "config", "channels.yaml")
 KEY_PATH = os.path.join(BASE_DIR, "service_key.json")
 DATASET_ID = "youtube_analytics"
 TABLE_ID = f"{DATASET_ID}.fact_video_metrics"
+TABLE_SCHEMA = [
+    bigquery.SchemaField("snapshot_at", "DATETIME"),
+    bigquery.SchemaField("sector", "STRING"),
+    bigquery.SchemaField("channel_id", "STRING"),
+    bigquery.SchemaField("channel_name", "STRING"),
+    bigquery.SchemaField("video_id", "STRING"),
+    bigquery.SchemaField("video_title", "STRING"),
+    bigquery.SchemaField("published_at", "TIMESTAMP"),
+    bigquery.SchemaField("view_count", "INTEGER"),
+    bigquery.SchemaField("like_count", "INTEGER"),
+    bigquery.SchemaField("comment_count", "INTEGER"),
+    bigquery.SchemaField("thumbnail_url", "STRING"),
+    bigquery.SchemaField("dominant_color", "STRING"),
+]
+# Arrow twin of TABLE_SCHEMA: naive timestamps load as DATETIME, UTC ones as TIMESTAMP
+ARROW_SCHEMA = pa.schema([
+    ("snapshot_at", pa.timestamp("us")),
+    ("sector", pa.string()),
+    ("channel_id", pa.string()),
+    ("channel_name", pa.string()),
+    ("video_id", pa.string()),
+    ("video_title", pa.string()),
+    ("published_at", pa.timestamp("us", tz="UTC")),
+    ("view_count", pa.int64()),
+    ("like_count", pa.int64()),
+    ("comment_count", pa.int64()),
+    ("thumbnail_url", pa.string()),
+    ("dominant_color", pa.string()),
+])
+YOUTUBE_API_URL = "https://www.googleapis.com/youtube/v3"
+PUBLISHED_AT_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+MAX_CONCURRENT_CHANNELS = 20
+THUMBNAIL_WORKERS = 32
 
 # --- AUTHENTICATION ---
 def get_api_key():
@@ -29,12 +74,22 @@ def get_api_key():
         raise ValueError("❌ YOUTUBE_API_KEY not found.")
     return api_key
 
+@lru_cache(maxsize=8)
+def _load_config_cached(path, mtime_ns, size):
+    with open(path, "r") as f:
+        return yaml.load(f, Loader=SafeLoader)
+
 def load_config():
-    with open(CONFIG_PATH, "r") as f:
-        return yaml.safe_load(f)
+    """Parsed channels.yaml, re-read only when the file's mtime or size changes. Treat as read-only."""
+    stat = os.stat(CONFIG_PATH)
+    return _load_config_cached(CONFIG_PATH, stat.st_mtime_ns, stat.st_size)
 
 def get_authenticated_service():
-    return build('youtube', 'v3', developerKey=get_api_key())
+    """aiohttp session for the YouTube Data API (key sent as a header). Must be opened inside the event loop."""
+    return aiohttp.ClientSession(
+        headers={"X-goog-api-key": get_api_key()},
+        timeout=aiohttp.ClientTimeout(total=30)
+    )
 
 def get_bq_credentials():
     if "GCP_SA_KEY" in os.environ:
@@ -49,73 +104,104 @@ def get_bq_credentials():
         pass
 
     if os.path.exists(KEY_PATH):
-        creds = service_account.Credentials.from_service_account_file(KEY_PATH)
         with open(KEY_PATH) as f:
-            project_id = json.load(f)["project_id"]
-        return creds, project_id
+            info = json.load(f)
+        return service_account.Credentials.from_service_account_info(info), info["project_id"]
         
     raise FileNotFoundError("❌ No GCP Credentials found.")
 
 # --- YOUTUBE LOGIC (ROBUST) ---
 
-def get_uploads_id(youtube, channel_id):
-    """Try to get the Uploads Playlist ID. Returns None if it fails."""
-    try:
-        res = youtube.channels().list(id=channel_id, part='contentDetails').execute()
-        if "items" in res and len(res["items"]) > 0:
-            return res['items'][0]['contentDetails']['relatedPlaylists']['uploads']
-    except Exception:
-        return None
-    return None
+async def youtube_get(session, resource, retries=3, **params):
+    """GET a YouTube Data API list endpoint. Retries 429/5xx with exponential backoff."""
+    url = f"{YOUTUBE_API_URL}/{resource}"
+    for attempt in range(retries + 1):
+        async with session.get(url, params=params) as resp:
+            if (resp.status != 429 and resp.status < 500) or attempt == retries:
+                resp.raise_for_status()
+                return await resp.json()
+        await asyncio.sleep(2 ** attempt)
+
+def chunked(items, size=50):
+    """Yield successive `size`-long slices (the YouTube API accepts up to 50 IDs per call)."""
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def derive_uploads_id(channel_id):
+    """Standard channels' Uploads Playlist ID is the channel ID with 'UC' swapped for 'UU' (no API call)."""
+    return 'UU' + channel_id[2:] if channel_id.startswith('UC') else None
 
-def get_videos_from_playlist(youtube, playlist_id, limit=5):
+async def get_uploads_ids(session, channel_ids):
+    """Map each channel ID to its Uploads Playlist ID, 50 channels per request. Failures are omitted."""
+    responses = await asyncio.gather(*(
+        youtube_get(session, 'channels', id=','.join(batch), part='contentDetails', maxResults=len(batch))
+        for batch in chunked(channel_ids)
+    ), return_exceptions=True)
+
+    uploads = {}
+    for res in responses:
+        if isinstance(res, Exception):
+            continue
+        for item in res.get('items', []):
+            uploads[item['id']] = item['contentDetails']['relatedPlaylists']['uploads']
+    return uploads
+
+def thumbnail_urls(snippet):
+    """(display URL, color-analysis URL): high-res for the dashboard, the ~3KB 'default' for color."""
+    thumbnails = snippet.get('thumbnails', {})
+    display = thumbnails.get('high', thumbnails.get('standard', thumbnails.get('default', {}))).get('url')
+    small = thumbnails.get('default', thumbnails.get('medium', {})).get('url')
+    return display, small or display
+
+async def get_videos_from_playlist(session, playlist_id, limit=5):
     """Method A: Fetch via Playlist (Cheapest & Best)"""
     try:
-        res = youtube.playlistItems().list(
-            playlistId=playlist_id, part='snippet', maxResults=limit
-        ).execute()
+        res = await youtube_get(
+            session, 'playlistItems', playlistId=playlist_id, part='snippet', maxResults=limit
+        )
         
         videos = []
         for item in res.get('items', []):
             snippet = item['snippet']
-            thumbnails = snippet.get('thumbnails', {})
-            thumb_url = thumbnails.get('high', thumbnails.get('standard', thumbnails.get('default', {}))).get('url')
+            thumb_url, color_thumb_url = thumbnail_urls(snippet)
             
             videos.append({
                 'video_id': snippet['resourceId']['videoId'],
                 'title': snippet['title'],
                 'published_at': snippet['publishedAt'],
                 'channel_title': snippet['channelTitle'],
-                'thumbnail_url': thumb_url
+                'thumbnail_url': thumb_url,
+                'color_thumbnail_url': color_thumb_url
             })
         return videos
     except Exception:
         return []
 
-def get_videos_from_activities(youtube, channel_id, limit=5):
+async def get_videos_from_activities(session, channel_id, limit=5):
     """Method B: Fetch via Activities (Fallback for Channels with hidden playlists)"""
     try:
         # print(f"   ℹ️ Switching to Activities fallback for {channel_id}...")
-        res = youtube.activities().list(
+        res = await youtube_get(
+            session, 'activities',
             channelId=channel_id,
             part='snippet,contentDetails',
             maxResults=limit + 5  # Fetch extra to skip non-upload activities
-        ).execute()
+        )
 
         videos = []
         for item in res.get('items', []):
             # Only keep actual video uploads
             if 'upload' in item['contentDetails']:
                 snippet = item['snippet']
-                thumbnails = snippet.get('thumbnails', {})
-                thumb_url = thumbnails.get('high', thumbnails.get('standard', thumbnails.get('default', {}))).get('url')
+                thumb_url, color_thumb_url = thumbnail_urls(snippet)
                 
                 videos.append({
                     'video_id': item['contentDetails']['upload']['videoId'],
                     'title': snippet['title'],
                     'published_at': snippet['publishedAt'],
                     'channel_title': snippet['channelTitle'],
-                    'thumbnail_url': thumb_url
+                    'thumbnail_url': thumb_url,
+                    'color_thumbnail_url': color_thumb_url
                 })
                 if len(videos) >= limit: break
         return videos
@@ -123,11 +209,17 @@ def get_videos_from_activities(youtube, channel_id, limit=5):
         print(f"   ❌ Activities method failed for {channel_id}: {e}")
         return []
 
-def get_video_stats(youtube, video_ids):
-    if not video_ids: return {}
-    try:
-        res = youtube.videos().list(id=','.join(video_ids), part='statistics').execute()
-        stats_map = {}
+async def get_video_stats(session, video_ids):
+    """Stats for any number of videos, 50 IDs per videos.list call. Failed batches are omitted."""
+    responses = await asyncio.gather(*(
+        youtube_get(session, 'videos', id=','.join(batch), part='statistics', maxResults=len(batch))
+        for batch in chunked(video_ids)
+    ), return_exceptions=True)
+
+    stats_map = {}
+    for res in responses:
+        if isinstance(res, Exception):
+            continue
         for item in res.get('items', []):
             stats = item['statistics']
             stats_map[item['id']] = {
@@ -135,80 +227,142 @@ def get_video_stats(youtube, video_ids):
                 'likes': int(stats.get('likeCount', 0)),
                 'comments': int(stats.get('commentCount', 0))
             }
-        return stats_map
-    except Exception:
-        return {}
+    return stats_map
 
 # --- MAIN ETL PIPELINE ---
 
+async def get_channel_videos(session, sem, cid, uploads_id, limit):
+    """Latest uploads for one channel (Playlist first, Activities as fallback). Empty if neither works."""
+    async with sem:
+        videos = []
+
+        # 1. Try Method A: Uploads Playlist
+        if uploads_id:
+            videos = await get_videos_from_playlist(session, uploads_id)
+
+        # 1b. Derived playlist ID came back empty: ask the API for the real one
+        if not videos and uploads_id is not None and uploads_id == derive_uploads_id(cid):
+            real_id = (await get_uploads_ids(session, [cid])).get(cid)
+            if real_id and real_id != uploads_id:
+                videos = await get_videos_from_playlist(session, real_id)
+
+        # 2. If Method A failed (empty or 404), Try Method B: Activities
+        if not videos:
+            videos = await get_videos_from_activities(session, cid, limit=limit)
+
+    if not videos:
+        print(f"   ⚠️ Skipping {cid} (Could not find videos via Playlist OR Activities)")
+    else:
+        print(f"   ✅ Fetched {len(videos)} videos for {videos[0]['channel_title']}")
+    return videos
+
+async def collect_metrics(config, snapshot_at):
+    """Fetch videos for every configured channel concurrently, then their stats in bulk."""
+    limit = config['settings']['max_videos_to_fetch']
+    sem = asyncio.Semaphore(MAX_CONCURRENT_CHANNELS)
+
+    async with get_authenticated_service() as session:
+        # Uploads playlists are derived from 'UC...' channel IDs; only the rest need a
+        # channels.list lookup (one round-trip per 50 channels)
+        channel_ids = [channel['id'].strip() for channels in config['sectors'].values() for channel in channels]
+        uploads_ids = {cid: derive_uploads_id(cid) for cid in channel_ids if derive_uploads_id(cid)}
+        lookup_ids = [cid for cid in channel_ids if cid not in uploads_ids]
+        if lookup_ids:
+            uploads_ids.update(await get_uploads_ids(session, lookup_ids))
+
+        # Phase 1: latest uploads for every channel
+        targets, tasks = [], []
+        for sector, channels in config['sectors'].items():
+            print(f"\n📂 Processing Sector: {sector.upper()} ({len(channels)} channels)")
+            for channel in channels:
+                cid = channel['id'].strip() # Strip whitespace safety
+                targets.append((sector, cid))
+                tasks.append(get_channel_videos(session, sem, cid, uploads_ids.get(cid), limit))
+        channel_videos = await asyncio.gather(*tasks)
+
+        # Phase 2: stats for all channels at once, 50 videos per videos.list call
+        all_ids = [vid['video_id'] for videos in channel_videos for vid in videos]
+        stats = await get_video_stats(session, all_ids)
+
+    # Phase 3: inner-join videos to their stats in one pass, then build each column in one go
+    # (color_thumbnail_url is only used for color analysis and is not uploaded)
+    joined = [
+        (sector, cid, vid, stats[vid['video_id']])
+        for (sector, cid), videos in zip(targets, channel_videos)
+        for vid in videos if vid['video_id'] in stats
+    ]
+    cols = {
+        'snapshot_at': [snapshot_at] * len(joined),
+        'sector': [sector for sector, _, _, _ in joined],
+        'channel_id': [cid for _, cid, _, _ in joined],
+        'channel_name': [vid['channel_title'] for _, _, vid, _ in joined],
+        'video_id': [vid['video_id'] for _, _, vid, _ in joined],
+        'video_title': [vid['title'] for _, _, vid, _ in joined],
+        'published_at': [vid['published_at'] for _, _, vid, _ in joined],
+        'view_count': [stat['views'] for _, _, _, stat in joined],
+        'like_count': [stat['likes'] for _, _, _, stat in joined],
+        'comment_count': [stat['comments'] for _, _, _, stat in joined],
+        'thumbnail_url': [vid['thumbnail_url'] for _, _, vid, _ in joined],
+        'color_thumbnail_url': [vid['color_thumbnail_url'] for _, _, vid, _ in joined],
+    }
+    return cols
+
+def dominant_colors(thumbnail_urls):
+    """Dominant color per thumbnail (in order). Thumbnails are analyzed on a thread pool."""
+    # Thumbnail downloads + color analysis are blocking, so overlap them on worker threads
+    with ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS) as pool:
+        return list(pool.map(get_dominant_color, thumbnail_urls))
+
+def parse_published_at(values):
+    """API publishedAt strings -> UTC timestamps, parsed with the fixed API format (no format sniffing)."""
+    strings = pa.array(values, type=pa.string())
+    try:
+        parsed = pc.strptime(strings, format=PUBLISHED_AT_FORMAT, unit='us')
+    except pa.ArrowInvalid:
+        # Off-format value (e.g. fractional seconds): let Arrow's ISO-8601 cast handle the column
+        return strings.cast(pa.timestamp('us', tz='UTC'))
+    return parsed.cast(pa.timestamp('us', tz='UTC'))
+
+def to_record_batch(cols):
+    """Typed Arrow batch from the column lists."""
+    arrays = dict(cols, published_at=parse_published_at(cols['published_at']))
+    return pa.RecordBatch.from_pydict(arrays, schema=ARROW_SCHEMA)
+
+def upload_batch(client, batch):
+    """Append an Arrow batch to BigQuery as an in-memory Parquet file (no DataFrame round-trip)."""
+    buf = BytesIO()
+    pq.write_table(pa.Table.from_batches([batch]), buf)
+    buf.seek(0)
+    job = client.load_table_from_file(
+        buf, TABLE_ID,
+        job_config=bigquery.LoadJobConfig(
+            schema=TABLE_SCHEMA,
+            source_format=bigquery.SourceFormat.PARQUET,
+            write_disposition=bigquery.WriteDisposition.WRITE_APPEND
+        )
+    )
+    job.result()
+
 def run_etl():
     print("🚀 Starting YouTube Velocity ETL...")
     
     config = load_config()
-    youtube = get_authenticated_service()
     creds, project_id = get_bq_credentials()
-    
-    all_metrics = []
-    
-    for sector, channels in config['sectors'].items():
-        print(f"\n📂 Processing Sector: {sector.upper()} ({len(channels)} channels)")
-        
-        for channel in channels:
-            cid = channel['id'].strip() # Strip whitespace safety
-            videos = []
-            
-            # 1. Try Method A: Uploads Playlist
-            uploads_id = get_uploads_id(youtube, cid)
-            if uploads_id:
-                videos = get_videos_from_playlist(youtube, uploads_id)
-            
-            # 2. If Method A failed (empty or 404), Try Method B: Activities
-            if not videos:
-                videos = get_videos_from_activities(youtube, cid, limit=config['settings']['max_videos_to_fetch'])
-            
-            if not videos:
-                print(f"   ⚠️ Skipping {cid} (Could not find videos via Playlist OR Activities)")
-                continue
 
-            # 3. Get Stats & Color
-            vid_ids = [v['video_id'] for v in videos]
-            stats = get_video_stats(youtube, vid_ids)
-            
-            for vid in videos:
-                vid_id = vid['video_id']
-                if vid_id in stats:
-                    # Optional: Print to show progress
-                    # print(f"   🎨 Analyzing: {vid['title'][:20]}...")
-                    dom_color = get_dominant_color(vid['thumbnail_url'])
-                    
-                    row = {
-                        'snapshot_at': datetime.utcnow(),
-                        'sector': sector,
-                        'channel_id': cid,
-                        'channel_name': vid['channel_title'],
-                        'video_id': vid_id,
-                        'video_title': vid['title'],
-                        'published_at': vid['published_at'],
-                        'view_count': stats[vid_id]['views'],
-                        'like_count': stats[vid_id]['likes'],
-                        'comment_count': stats[vid_id]['comments'],
-                        'thumbnail_url': vid['thumbnail_url'],
-                        'dominant_color': dom_color
-                    }
-                    all_metrics.append(row)
-            
-            print(f"   ✅ Fetched {len(videos)} videos for {videos[0]['channel_title'] if videos else cid}")
+    # One instant for the whole run; snapshot_at is a DATETIME column, so store it as naive UTC
+    snapshot_at = datetime.now(timezone.utc).replace(tzinfo=None)
+    cols = asyncio.run(collect_metrics(config, snapshot_at))
+    row_count = len(cols['video_id'])
 
-    if all_metrics:
-        df = pd.DataFrame(all_metrics)
-        df['snapshot_at'] = pd.to_datetime(df['snapshot_at'])
-        df['published_at'] = pd.to_datetime(df['published_at'])
-        
-        print(f"\n📦 Uploading {len(df)} rows to BigQuery...")
+    if row_count:
+        print(f"\n📦 Uploading {row_count} rows to BigQuery...")
         try:
-            pandas_gbq.to_gbq(
-                df, TABLE_ID, project_id=project_id, if_exists='append', credentials=creds
-            )
+            client = bigquery.Client(credentials=creds, project=project_id)
+
+            cols['dominant_color'] = dominant_colors(cols.pop('color_thumbnail_url'))
+            # The whole run is already one compact batch: a single load job keeps the append atomic
+            upload_batch(client, to_record_batch(cols))
+
             print("✅ ETL Success! Data is live.")
         except Exception as e:
             print(f"❌ BigQuery Upload Failed: {e}")
@@ -1,44 +1,78 @@
+import os
+import time
+import atexit
+import shelve
+import threading
 import requests
+from functools import lru_cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from PIL import Image
 from io import BytesIO
-from sklearn.cluster import KMeans
-import numpy as np
 
+# Shared keep-alive pool: every worker thread reuses warm connections to i.ytimg.com
+_SESSION = requests.Session()
+_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=32, pool_maxsize=64,
+    max_retries=Retry(total=2, backoff_factor=0.3)
+))
+
+# Cross-run color cache. Thumbnail URLs (.../vi/<id>/default.jpg) are reused when a
+# creator swaps the thumbnail, so entries expire instead of living forever.
+CACHE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".thumb_color_cache")
+CACHE_TTL_SECONDS = 24 * 60 * 60
+
+_cache_lock = threading.Lock()  # shelve is not thread-safe
+_color_cache = None
+
+def _persistent_cache():
+    """Lazily open the shelve file (call with _cache_lock held). Falls back to a dict if unwritable."""
+    global _color_cache
+    if _color_cache is None:
+        try:
+            _color_cache = shelve.open(CACHE_PATH)
+            atexit.register(_color_cache.close)
+        except Exception as e:
+            print(f"⚠️ Color cache unavailable ({CACHE_PATH}): {e}")
+            _color_cache = {}
+    return _color_cache
+
+@lru_cache(maxsize=4096)
 def get_dominant_color(image_url):
     """
     Downloads an image and returns its dominant color as a HEX string (e.g., '#FF0000').
-    Uses K-Means clustering to ignore small details and find the 'Main Theme'.
+    Averages all pixels to find the 'Main Theme' color.
+    Results are memoized per URL in-process and persisted across runs for CACHE_TTL_SECONDS.
     """
     if not image_url:
         return None
 
+    with _cache_lock:
+        cached = _persistent_cache().get(image_url)
+    if cached and time.time() - cached[1] < CACHE_TTL_SECONDS:
+        return cached[0]
+
     try:
         # 1. Download Image (In-Memory)
-        response = requests.get(image_url, timeout=5)
+        response = _SESSION.get(image_url, timeout=5)
         response.raise_for_status()
         img = Image.open(BytesIO(response.content))
+        # JPEG fast path: only the mean color is needed, so let libjpeg decode at 1/8 scale
+        # (DCT-domain downscaling; 120x90 -> 15x12). No-op for other formats.
+        img.draft('RGB', (1, 1))
         
-        # 2. Resize to speed up processing (50x50 pixels is enough)
-        img = img.resize((50, 50))
-        
-        # 3. Convert to RGB and numpy array
+        # 2. Convert to RGB (no pre-resize: 'default' thumbnails are already only 120x90)
         if img.mode != 'RGB':
             img = img.convert('RGB')
+
+        # 3. Box-filter down to a single pixel = mean of all pixels, computed in PIL's C core
+        dominant_color = img.resize((1, 1), Image.Resampling.BOX).getpixel((0, 0))
         
-        # Reshape image data to a list of RGB pixels
-        # (50 * 50 pixels, 3 color channels)
-        img_array = np.array(img).reshape((50 * 50, 3))
-
-        # 4. Use K-Means Clustering to find the "Center" color
-        # n_clusters=1 means "Find the single most common average color"
-        kmeans = KMeans(n_clusters=1, n_init=10)
-        kmeans.fit(img_array)
-        
-        # Get RGB values of the center
-        dominant_color = kmeans.cluster_centers_[0].astype(int)
-        
-        # 5. Convert RGB to HEX
+        # 4. Convert RGB to HEX
         hex_color = '#{:02x}{:02x}{:02x}'.format(*dominant_color)
+
+        with _cache_lock:
+            _persistent_cache()[image_url] = (hex_color, time.time())
         return hex_color
 
     except Exception as e:
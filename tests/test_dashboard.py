@@ -0,0 +1,98 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dashboard"))
+import app  # noqa: E402
+
+
+class LttbIndicesTest(unittest.TestCase):
+    def test_short_series_is_kept_whole(self):
+        x = np.arange(10)
+        np.testing.assert_array_equal(app.lttb_indices(x, x, 10), np.arange(10))
+        np.testing.assert_array_equal(app.lttb_indices(x, x, 50), np.arange(10))
+
+    def test_fewer_than_three_points_requested_keeps_everything(self):
+        x = np.arange(100)
+        np.testing.assert_array_equal(app.lttb_indices(x, x, 2), np.arange(100))
+
+    def test_picks_n_out_increasing_indices_with_endpoints(self):
+        x = np.arange(10_000)
+        keep = app.lttb_indices(x, np.sin(x / 100), 500)
+        self.assertEqual(len(keep), 500)
+        self.assertEqual(keep[0], 0)
+        self.assertEqual(keep[-1], 9_999)
+        self.assertTrue(np.all(np.diff(keep) > 0))
+
+    def test_keeps_the_spike(self):
+        x = np.arange(1_000)
+        y = np.zeros(1_000)
+        y[437] = 50.0
+        self.assertIn(437, app.lttb_indices(x, y, 20))
+
+
+class DownsampleTracesTest(unittest.TestCase):
+    def test_small_frame_is_returned_untouched(self):
+        df = pd.DataFrame({"t": range(5), "v": range(5), "g": "a"})
+        self.assertIs(app.downsample_traces(df, "t", "v", "g", n_out=10), df)
+
+    def test_caps_each_trace_and_keeps_row_order(self):
+        t = pd.date_range("2024-01-01", periods=3_000, freq="min", tz="Asia/Kolkata")
+        df = pd.DataFrame({
+            "t": np.concatenate([t, t[:500]]),
+            "v": np.arange(3_500),
+            "g": ["a"] * 3_000 + ["b"] * 500,
+        })
+        out = app.downsample_traces(df, "t", "v", "g", n_out=1_000)
+        self.assertEqual(out.groupby("g").size().to_dict(), {"a": 1_000, "b": 500})
+        self.assertTrue(out.index.is_monotonic_increasing)
+
+    def test_sorts_each_trace_by_x_before_bucketing(self):
+        df = pd.DataFrame({"t": np.arange(300)[::-1], "v": np.arange(300), "g": "a"})
+        out = app.downsample_traces(df, "t", "v", "g", n_out=50)
+        self.assertEqual(len(out), 50)
+        self.assertEqual(set(out["t"]) & {0, 299}, {0, 299})
+
+
+class FormatViewsTest(unittest.TestCase):
+    def test_scalar_magnitudes(self):
+        self.assertEqual(app.format_views(999), "999")
+        self.assertEqual(app.format_views(500_000), "500.0K")
+        self.assertEqual(app.format_views(31_392_500), "31.4M")
+        self.assertEqual(app.format_views(np.int32(1_234)), "1.2K")
+
+    def test_whole_column(self):
+        labels = app.format_views(pd.Series([5, 2_000, 3_000_000], dtype="int32"))
+        self.assertEqual(labels.tolist(), ["5", "2.0K", "3.0M"])
+
+    def test_missing_counts_are_not_available(self):
+        self.assertEqual(app.format_views(np.nan), "N/A")
+        labels = app.format_views(pd.Series([1.0, np.nan, 2e6]))
+        self.assertEqual(labels.tolist(), ["1", "N/A", "2.0M"])
+
+
+
+class HeatmapMatrixTest(unittest.TestCase):
+    def test_scatters_counts_into_day_by_hour_grid(self):
+        df_heat = pd.DataFrame({
+            "publish_day": ["Monday", "Sunday", "Wednesday"],
+            "publish_hour": [0, 23, 9],
+            "count": [3, 4, 1],
+        })
+        grid = app.heatmap_matrix(df_heat)
+        self.assertEqual(grid.shape, (7, 24))
+        self.assertEqual(grid[0, 0], 3)
+        self.assertEqual(grid[6, 23], 4)
+        self.assertEqual(grid[2, 9], 1)
+        self.assertEqual(grid.sum(), 8)
+
+    def test_empty_summary_is_all_zeros(self):
+        df_heat = pd.DataFrame({"publish_day": [], "publish_hour": np.array([], dtype=np.int64), "count": []})
+        self.assertEqual(app.heatmap_matrix(df_heat).sum(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
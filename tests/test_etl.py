@@ -0,0 +1,40 @@
+import datetime
+import os
+import sys
+import unittest
+
+import pyarrow as pa
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+import etl  # noqa: E402
+
+
+class ParsePublishedAtTest(unittest.TestCase):
+    def test_api_format_parses_to_utc_timestamps(self):
+        parsed = etl.parse_published_at(["2024-05-01T10:00:00Z", None])
+        self.assertEqual(parsed.type, pa.timestamp("us", tz="UTC"))
+        self.assertEqual(
+            parsed[0].as_py(),
+            datetime.datetime(2024, 5, 1, 10, 0, tzinfo=datetime.timezone.utc),
+        )
+        self.assertFalse(parsed[1].is_valid)
+
+    def test_off_format_values_fall_back_to_iso_cast(self):
+        parsed = etl.parse_published_at(["2024-05-01T10:00:00.5Z"])
+        self.assertEqual(
+            parsed[0].as_py(),
+            datetime.datetime(2024, 5, 1, 10, 0, 0, 500000, tzinfo=datetime.timezone.utc),
+        )
+
+
+class DeriveUploadsIdTest(unittest.TestCase):
+    def test_uc_channel_swaps_prefix(self):
+        self.assertEqual(etl.derive_uploads_id("UCX6OQ3DkcsbYNE6H8uQQuVA"), "UUX6OQ3DkcsbYNE6H8uQQuVA")
+
+    def test_other_ids_need_a_lookup(self):
+        self.assertIsNone(etl.derive_uploads_id("HCleg"))
+        self.assertIsNone(etl.derive_uploads_id(""))
+
+
+if __name__ == "__main__":
+    unittest.main()